@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from urllib.parse import urljoin
 from typing import Iterator
-from uuid import uuid4
+import itertools
 
 import scrapy
 from scrapy.spiders import CrawlSpider
@@ -23,6 +23,9 @@ class DemoSpider(CrawlSpider):
     allowed_domains = ["webscraper.io"]
     start_urls = ["https://webscraper.io/test-sites/e-commerce/allinone"]
 
+    # Cheap sequential ids; the demo doesn't need random UUIDs
+    _id_counter = itertools.count()
+
     custom_settings = {
         # You can override batch size if you want to see more flush cycles:
         # "MEILI_BATCH_SIZE": 3,
@@ -49,7 +52,7 @@ class DemoSpider(CrawlSpider):
             url = urljoin(response.url, href) if href else response.url
 
             doc = {
-                "id": str(uuid4()),  # just for demo purposes
+                "id": f"{self.name}-{next(self._id_counter)}",  # just for demo purposes
                 "url": url,
                 "title": title.strip(),
                 "source": "webscraper.io-allinone",
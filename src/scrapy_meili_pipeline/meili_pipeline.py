@@ -1,17 +1,58 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union
+import gzip
 import logging
+import time
 
-from itemadapter import ItemAdapter
-import meilisearch
-from meilisearch.client import Client
-from meilisearch.index import Index
 from scrapy import Spider
 from scrapy.crawler import Crawler
 
+if TYPE_CHECKING:
+    # meilisearch (requests, pydantic), httpx, orjson and itemadapter are imported lazily to keep
+    # Scrapy startup fast
+    import httpx
+    from meilisearch.client import Client
+    from meilisearch.index import Index
+    from meilisearch.models.task import Task
+
 logger = logging.getLogger(__name__)
 
+_TERMINAL_STATUSES = frozenset({"succeeded", "failed", "canceled"})
+_POLL_INITIAL_DELAY = 0.01  # seconds; doubled after every poll up to MEILI_TASK_INTERVAL
+_GZIP_MIN_BYTES = 64 * 1024  # payloads above this size are gzip-compressed before sending
+_MAX_FAILED_TASKS = 1000  # failed tasks kept for the close report; older ones are only counted
+_JSON_HEADERS = {"Content-Type": "application/json"}
+_GZIP_JSON_HEADERS = {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+
+
+@dataclass(frozen=True)
+class _DocumentsTask:
+    """Minimal TaskInfo-like result of a documents POST (only `task_uid` is needed)."""
+
+    task_uid: Optional[int]
+
+
+@dataclass(slots=True)
+class _FailedErr:
+    """Error details of a `_FailedTask`, shaped like a Meilisearch task error."""
+
+    code: str
+    message: str
+    link: Optional[str] = None
+
+
+@dataclass(slots=True)
+class _FailedTask:
+    """Record of a task whose outcome is unknown because waiting for it failed."""
+
+    taskUid: Optional[int]
+    error: _FailedErr
+    status: str = "failed"
+
 
 class MeiliSearchPipeline:
     """
@@ -19,13 +60,21 @@ class MeiliSearchPipeline:
 
     Simplified logic:
     - Keep one internal list of pending tasks (`_tasks`).
-    - `process_item` buffers items; when buffer reaches `batch_size`, perform a flush.
-    - Each flush adds a Meilisearch task to `_tasks`, then immediately checks all tasks
-      in `_tasks`. Failed tasks are moved to `_failed_tasks`. Succeeded tasks clear `_tasks`.
+    - `process_item` buffers items keyed by primary key (a repeated id replaces the buffered
+      document); when buffer reaches the current batch size, perform a flush.
+      If `max_batch_size` is larger than `batch_size`, the batch size starts at `batch_size` and
+      doubles (up to `max_batch_size`) for as long as the observed send time per document keeps dropping.
+    - Each flush hands the batch to a background sender thread and returns right away, so the
+      reactor keeps crawling while the HTTP request is in flight. Finished sends add their
+      Meilisearch task to `_tasks` without waiting for indexing. Tasks are only checked once
+      more than `max_inflight` are pending. Failed tasks, and batches that could not be sent,
+      are moved to `_failed_tasks`.
     - On `close_spider`, flush remaining items (if any), check remaining tasks,
-      and finally raise if any failed tasks were detected.
+      and finally log any failed tasks that were detected.
 
     Supports ONLY the modern Meilisearch Python client (TaskInfo / Pydantic models).
+    Documents are sent through a persistent `httpx.Client` (HTTP/2, keep-alive pool) so
+    every flush reuses the same connection instead of paying a new handshake.
 
     Supported Scrapy settings (global or spider.custom_settings):
 
@@ -34,9 +83,12 @@ class MeiliSearchPipeline:
     MEILI_INDEX (str)                   - index name (required)
     MEILI_PRIMARY_KEY (str | None)      - primary key for new index
     MEILI_INDEX_SETTINGS (dict)         - passed to update_settings
-    MEILI_BATCH_SIZE (int)              - default 1000 (documents per flush)
+    MEILI_BATCH_SIZE (int)              - default 1000 (initial documents per flush)
+    MEILI_MAX_BATCH (int)               - default MEILI_BATCH_SIZE (upper bound for adaptive batch growth;
+                                          set it higher to enable growth)
     MEILI_TASK_TIMEOUT (int)            - seconds, default 120
-    MEILI_TASK_INTERVAL (int)           - seconds, default 1
+    MEILI_TASK_INTERVAL (int)           - seconds, default 1 (max delay between task polls)
+    MEILI_MAX_INFLIGHT (int)            - default 8 (pending tasks before waiting on them)
     """
 
     def __init__(
@@ -49,6 +101,8 @@ class MeiliSearchPipeline:
         batch_size: int = 1000,
         task_timeout: int = 120,
         task_interval: int = 1,
+        max_inflight: int = 8,
+        max_batch_size: Optional[int] = None,
     ) -> None:
         self.url = url
         self.api_key = api_key
@@ -58,14 +112,36 @@ class MeiliSearchPipeline:
         self.batch_size = max(1, int(batch_size))
         self.task_timeout = int(task_timeout)
         self.task_interval = int(task_interval)
+        # Polling schedule, computed once: first delay and ceiling of the exponential backoff
+        self._poll_first_delay = min(_POLL_INITIAL_DELAY, self.task_interval)
+        self._poll_max_delay = self.task_interval
+        self.max_inflight = max(0, int(max_inflight))
+        # Adaptive growth is opt-in: without an explicit upper bound the batch size stays fixed.
+        self.max_batch_size = self.batch_size if max_batch_size is None else max(self.batch_size, int(max_batch_size))
+        # Field used to collapse repeated documents in the buffer; None (unknown) disables that.
+        # `_ensure_index` replaces it with the existing index's primary key, which is what Meilisearch uses.
+        self._pk_field: Optional[str] = self.primary_key
+
+        # Request constants, built once instead of on every flush
+        self._docs_url = f"/indexes/{self.index_name}/documents"
+        self._auth_headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+        # Adaptive batching state
+        self._cur_batch = self.batch_size
+        self._last_per_doc_ms: Optional[float] = None
 
         self._client: Optional[Client] = None
-        self._index: Optional[meilisearch.index.Index] = None
+        self._index: Optional[Index] = None
+        self._http: Optional[httpx.Client] = None
+        self._sender: Optional[ThreadPoolExecutor] = None
 
         # Internal buffers
-        self._buffer: List[Dict[str, Any]] = []  # items buffer
+        self._buffer: Dict[Any, Dict[str, Any]] = {}  # items buffer, keyed by primary key
+        self._sending: deque[Future[Tuple[_DocumentsTask, float, int]]] = deque()  # batches being sent
         self._tasks: List[Any] = []  # pending TaskInfo objects
-        self._failed_tasks: List[Any] = []  # failed TaskInfo objects
+        self._failed_tasks: deque[Any] = deque(maxlen=_MAX_FAILED_TASKS)  # failed TaskInfo objects (latest)
+        self._failed_overflow = 0  # failed tasks dropped from `_failed_tasks`
+        self._items_flushed = False  # whether any documents batch was sent
 
     # ---------- Scrapy hooks ---------- #
 
@@ -81,69 +157,137 @@ class MeiliSearchPipeline:
         if not index_name:
             raise ValueError("MEILI_INDEX is missing in Scrapy settings.")
 
+        batch_size = s.getint("MEILI_BATCH_SIZE", 1000)
+        if batch_size < 10:
+            logger.warning(
+                "MEILI_BATCH_SIZE=%d is very small; each batch costs one HTTP round-trip. "
+                "Consider >=100 for throughput.",
+                batch_size,
+            )
+
         return cls(
             url=url,
             api_key=s.get("MEILI_API_KEY"),
             index_name=index_name,
             primary_key=s.get("MEILI_PRIMARY_KEY"),
             index_settings=s.getdict("MEILI_INDEX_SETTINGS", {}),
-            batch_size=s.getint("MEILI_BATCH_SIZE", 1000),
+            batch_size=batch_size,
             task_timeout=s.getint("MEILI_TASK_TIMEOUT", 120),
             task_interval=s.getint("MEILI_TASK_INTERVAL", 1),
+            max_inflight=s.getint("MEILI_MAX_INFLIGHT", 8),
+            max_batch_size=s.getint("MEILI_MAX_BATCH", batch_size),
         )
 
     def open_spider(self, spider: Spider) -> None:
+        import httpx
+        import meilisearch
+
         logger.info("MeiliSearchPipeline: connecting to %s", self.url)
         self._client = meilisearch.Client(self.url, self.api_key)
+        self._http = httpx.Client(
+            base_url=self.url,
+            headers=self._auth_headers,
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=16, keepalive_expiry=60),
+        )
 
         # Ensure index exists; wait immediately so subsequent ops are safe.
-        self._index = self._ensure_index(self._client, self.index_name, self.primary_key)
+        try:
+            self._index = self._ensure_index(self._client, self._http, self.index_name, self.primary_key)
+
+            # Apply settings if provided — collect the task, but we won't wait here.
+            if self.index_settings:
+                logger.info("MeiliSearchPipeline: applying settings for index '%s'", self.index_name)
+                task = self._index.update_settings(self.index_settings)
+                self._tasks.append(task)
+                # Per specifiche: lo stato viene verificato ai flush/close, non qui.
+        except BaseException:
+            # close_spider isn't called when open_spider fails: don't leak the connection pool.
+            self._http.close()
+            self._http = None
+            raise
 
-        # Apply settings if provided — collect the task, but we won't wait here.
-        if self.index_settings:
-            logger.info("MeiliSearchPipeline: applying settings for index '%s'", self.index_name)
-            task = self._index.update_settings(self.index_settings)
-            self._tasks.append(task)
-            # Per specifiche: lo stato viene verificato ai flush/close, non qui.
+        # Start the sender only once the index is usable, so a failed setup leaves nothing running.
+        # A single sender thread keeps batches in order (later documents must win on the server).
+        self._sender = ThreadPoolExecutor(max_workers=1, thread_name_prefix="meili-sender")
 
     def close_spider(self, spider: Spider) -> None:
-        # If items remain, flush them (will also check tasks).
-        if self._buffer:
-            self._flush_and_check()
-
-        # If any tasks are still pending (e.g., only settings were added), check them now.
-        if self._tasks:
-            self._check_all_tasks()
+        try:
+            # If items remain, flush them.
+            if self._buffer:
+                self._flush_and_check()
 
-        # If we collected any failed tasks, raise with details.
-        if self._failed_tasks:
-            for t in self._failed_tasks:
-                logger.error("Meilisearch failed task: %r", t)
+            # Wait for every task still pending (in-flight batches, settings). If no documents were
+            # ever sent, only the settings task is left: Meilisearch applies it regardless, so don't wait.
+            if self._items_flushed and (self._tasks or self._sending):
+                self._check_all_tasks()
+            elif self._tasks:
+                logger.info(
+                    "MeiliSearchPipeline: no documents sent, not waiting for %d pending task(s)", len(self._tasks)
+                )
+        finally:
+            # Report and clean up even if flushing or waiting raised.
+            # If we collected any failed tasks, log them with details.
+            if self._failed_tasks:
+                for t in self._failed_tasks:
+                    logger.error("Meilisearch failed task: %r", t)
+                logger.error(
+                    "MeiliSearchPipeline: %d failures (%d truncated)",
+                    len(self._failed_tasks) + self._failed_overflow,
+                    self._failed_overflow,
+                )
 
-        # cleanup
-        self._buffer.clear()
-        self._tasks.clear()
-        self._client = None
-        self._index = None
+            # cleanup
+            self._buffer.clear()
+            self._tasks.clear()
+            self._sending.clear()
+            if self._sender:
+                self._sender.shutdown()
+            self._sender = None
+            if self._http:
+                self._http.close()
+            self._http = None
+            self._client = None
+            self._index = None
+
+    def accept(self, item: Any) -> bool:
+        """Return False to pass `item` through without indexing it. Override in subclasses."""
+        return True
 
     def process_item(self, item: Any, spider: Spider) -> Any:
-        # Buffer item; flush when batch size reached
-        doc = dict(ItemAdapter(item).asdict())
-        self._buffer.append(doc)
+        if not self.accept(item):
+            return item
+
+        # Buffer item; flush when batch size reached. asdict() already returns a new dict
+        # (recursively converting nested items), so no extra copy is needed.
+        from itemadapter import ItemAdapter
 
-        if len(self._buffer) >= self.batch_size:
+        doc = ItemAdapter(item).asdict()
+        # Last write wins for a repeated primary key; documents without one are always kept.
+        pk = doc.get(self._pk_field) if self._pk_field else None
+        try:
+            self._buffer[pk if pk is not None else object()] = doc
+        except TypeError:  # unhashable key (e.g. a list): let Meilisearch reject the document
+            self._buffer[object()] = doc
+
+        if len(self._buffer) >= self._cur_batch:
             self._flush_and_check()
 
         return item
 
     # ---------- Internals ---------- #
 
-    def _ensure_index(self, client: Client, index_name: str, primary_key: Optional[str]) -> Index:
+    def _ensure_index(self, client: Client, http: httpx.Client, index_name: str, primary_key: Optional[str]) -> Index:
         """Create the index if missing, and wait for creation to avoid races."""
+        from meilisearch.errors import MeilisearchApiError, MeilisearchTimeoutError
+
         try:
-            client.get_index(index_name)
+            existing = client.get_index(index_name)
+            # Meilisearch dedups on the index's own primary key (MEILI_PRIMARY_KEY only applies to a
+            # new index), so the buffer must use the same field.
+            self._pk_field = getattr(existing, "primary_key", None)
             idx = client.index(index_name)
-        except meilisearch.errors.MeilisearchApiError:
+        except MeilisearchApiError:
             logger.info(
                 "MeiliSearchPipeline: creating index '%s'%s",
                 index_name,
@@ -151,93 +295,179 @@ class MeiliSearchPipeline:
             )
             task = client.create_index(index_name, {"primaryKey": primary_key} if primary_key else {})
             # Wait immediately for index creation
-            result = client.wait_for_task(
-                self._task_uid(task),
-                timeout_in_ms=self.task_timeout * 1000,
-                interval_in_ms=self.task_interval * 1000,
-            )
-            self._check_task(result)
+            uid = self._task_uid(task)
+            results = self._poll_tasks(http, [uid])
+            if not results or results[0].status not in _TERMINAL_STATUSES:
+                raise MeilisearchTimeoutError(f"timeout of {self.task_timeout}s has exceeded waiting for task {uid}")
+            self._check_task(results[0])
             idx = client.index(index_name)
         return idx
 
     def _flush_and_check(self) -> None:
-        """Send current buffer to Meilisearch, store its task, then check all tasks."""
+        """Send current buffer to Meilisearch and store its task; check tasks once too many are pending."""
         if not self._buffer:
             # Even with empty buffer, we may still want to check pending tasks from settings
-            if self._tasks:
+            if self._tasks or self._sending:
                 self._check_all_tasks()
             return
 
-        if not self._index:
+        if not (self._index and self._http and self._sender):
             raise RuntimeError("Meilisearch index is not initialized.")
 
-        batch = self._buffer
-        self._buffer = []
+        batch = list(self._buffer.values())
+        self._buffer.clear()
 
-        try:
-            logger.info("MeiliSearchPipeline: sending batch of %d documents", len(batch))
-            task = self._index.add_documents(batch)
+        logger.info("MeiliSearchPipeline: sending batch of %d documents", len(batch))
+        self._sending.append(self._sender.submit(self._send_batch, self._http, batch))
+        self._items_flushed = True
+        self._collect_sent(wait=False)
+
+        # Don't wait for indexing after every flush; only drain once too many tasks are pending.
+        if len(self._tasks) + len(self._sending) > self.max_inflight:
+            self._check_all_tasks()
+
+    def _send_batch(self, http: httpx.Client, batch: List[Dict[str, Any]]) -> Tuple[_DocumentsTask, float, int]:
+        """POST a batch (runs on the sender thread); return its task, the elapsed ms and the batch size."""
+        t0 = time.perf_counter()
+        payload, headers = self._encode_batch(batch)
+        response = http.post(self._docs_url, content=payload, headers=headers)
+        self._raise_for_status(response)
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        task = _DocumentsTask(task_uid=response.json().get("taskUid"))
+        logger.debug("MeiliSearchPipeline: batch enqueued as task %d", self._task_uid(task))
+        return task, elapsed_ms, len(batch)
+
+    def _collect_sent(self, *, wait: bool) -> None:
+        """Move finished sends from `_sending` into `_tasks`; with `wait`, block until all sends are done."""
+        while self._sending and (wait or self._sending[0].done()):
+            future = self._sending.popleft()
+            try:
+                task, elapsed_ms, size = future.result()
+            except Exception as e:
+                from meilisearch.errors import MeilisearchApiError
+
+                # Record it like a failed task and keep going: the batches queued behind it are still sent.
+                logger.warning("Error inserting batch into Meilisearch: %s", e)
+                if isinstance(e, MeilisearchApiError):
+                    err = _FailedErr(e.code or "send_error", e.message, e.link)
+                    self._record_failure(_FailedTask(taskUid=None, error=err))
+                else:
+                    self._record_failure(self._mk_failed_stub(None, message=str(e), code="send_error"))
+                continue
             self._tasks.append(task)
-        except Exception as e:
-            logger.exception("Error inserting batch into Meilisearch: %s", e)
-            raise
 
-        # After each flush, check **all** pending tasks;
-        # failed ones go to _failed_tasks, and we clear _tasks.
-        self._check_all_tasks()
+            # Only full batches are representative (the last one at close is usually partial).
+            if size >= self._cur_batch:
+                self._adapt_batch_size(elapsed_ms / size)
+
+    @staticmethod
+    def _encode_batch(batch: List[Dict[str, Any]]) -> Tuple[bytes, Dict[str, str]]:
+        """Serialize a batch with orjson; gzip it when it's large enough to be worth the CPU."""
+        import orjson
+
+        # Non-str keys (e.g. year -> count maps) are stringified like the stdlib json module does.
+        payload = orjson.dumps(batch, option=orjson.OPT_NON_STR_KEYS)
+        if len(payload) > _GZIP_MIN_BYTES:
+            return gzip.compress(payload, compresslevel=1), _GZIP_JSON_HEADERS
+        return payload, _JSON_HEADERS
 
     def _check_all_tasks(self) -> None:
         """Wait for and validate all tasks in `_tasks`; collect failures; then clear `_tasks`."""
-        if not (self._client and self._tasks):
+        self._collect_sent(wait=True)
+        if not (self._http and self._tasks):
             self._tasks.clear()
             return
 
         pending = self._tasks
         self._tasks = []  # reset before waiting; we'll only keep failures elsewhere
 
-        for t in pending:
-            uid = self._task_uid(t)
-            try:
-                result = self._client.wait_for_task(
-                    uid,
-                    timeout_in_ms=self.task_timeout * 1000,
-                    interval_in_ms=self.task_interval * 1000,
-                )
+        uids = sorted(self._task_uid(t) for t in pending)
+        try:
+            results = self._poll_tasks(self._http, uids)
+        except Exception as e:
+            # Network / unexpected errors — classify as failure with a stub
+            logger.warning("Waiting for tasks %s failed: %s", uids, e)
+            for uid in uids:
+                self._record_failure(self._mk_failed_stub(uid, message=str(e)))
+            return
+
+        for result in results:
+            if result.status in _TERMINAL_STATUSES:
                 self._check_task(result)
-            except Exception as e:
-                # Network / timeout / unexpected errors — classify as failure with a stub
-                logger.warning("Waiting for task %s failed: %s", uid, e)
-                self._failed_tasks.append(self._mk_failed_stub(uid, message=str(e)))
+            else:
+                logger.warning("Task %s still %s after %ss", result.uid, result.status, self.task_timeout)
+                self._record_failure(
+                    self._mk_failed_stub(result.uid, message=f"task still {result.status} after timeout")
+                )
+
+        # A task missing from the response was never confirmed, so it must not count as a success.
+        for uid in sorted(set(uids) - {result.uid for result in results}):
+            logger.warning("Task %s not found while waiting for tasks", uid)
+            self._record_failure(self._mk_failed_stub(uid, message="task not found"))
+
+    def _poll_tasks(self, http: httpx.Client, uids: List[int]) -> List[Task]:
+        """
+        Poll the status of all `uids` with one `GET /tasks` per cycle until they are done or time runs out.
+
+        The delay between polls backs off exponentially from 10 ms up to `task_interval`, so quick tasks
+        are picked up almost immediately while slow ones don't hammer the server.
+        """
+        from meilisearch.models.task import Task
+
+        params: Dict[str, Union[str, int]] = {"uids": ",".join(str(uid) for uid in uids), "limit": len(uids)}
+        deadline = time.monotonic() + self.task_timeout
+        delay = self._poll_first_delay
+        while True:
+            response = http.get("/tasks", params=params)
+            self._raise_for_status(response)
+            results = [Task(**info) for info in response.json()["results"]]
+            # Enqueued tasks are listed right away, so a missing uid won't show up later: don't wait for it.
+            # The caller records missing uids as failures.
+            if all(t.status in _TERMINAL_STATUSES for t in results) or time.monotonic() >= deadline:
+                return results
+            time.sleep(delay)
+            delay = min(delay * 2, self._poll_max_delay)
+
+    def _adapt_batch_size(self, per_doc_ms: float) -> None:
+        """Double the batch size while the send time per document keeps improving by at least 10%."""
+        if self._last_per_doc_ms is not None and per_doc_ms < 0.9 * self._last_per_doc_ms:
+            new_size = min(self._cur_batch * 2, self.max_batch_size)
+            if new_size != self._cur_batch:
+                logger.info("MeiliSearchPipeline: growing batch size %d -> %d", self._cur_batch, new_size)
+                self._cur_batch = new_size
+        self._last_per_doc_ms = per_doc_ms
+
+    @staticmethod
+    def _raise_for_status(response: httpx.Response) -> None:
+        """Raise MeilisearchApiError (with Meilisearch's error code and message) for a non-2xx response."""
+        if response.is_success:
+            return
+        from meilisearch.errors import MeilisearchApiError
+
+        # Only `status_code` and `text` are read, which httpx.Response has too.
+        raise MeilisearchApiError(f"{response.status_code} {response.reason_phrase}", response)  # type: ignore[arg-type]
 
     @staticmethod
     def _task_uid(task: Any) -> int:
         """Extract UID from TaskInfo-like object (modern client)."""
-        uid = getattr(task, "task_uid", None)
-        if uid is None:
-            raise RuntimeError("Task object has no uid/taskUid attribute (unsupported client?).")
-        return int(uid)
+        try:
+            return int(task.task_uid)
+        except (AttributeError, TypeError):  # missing attribute, or None
+            raise RuntimeError("Task object has no uid/taskUid attribute (unsupported client?).") from None
 
     def _check_task(self, task_info: Any) -> None:
         """Record failure if task ended with 'failed' status."""
         status = getattr(task_info, "status", None)
         if status == "failed":
-            self._failed_tasks.append(task_info)
-
-    @staticmethod
-    def _mk_failed_stub(uid: Optional[int], *, message: str) -> Any:
-        """Create a minimal object to record a failed/unknown task when wait_for_task itself fails."""
+            self._record_failure(task_info)
 
-        class _Stub:
-            def __init__(self, uid: Optional[int], message: str):
-                self.taskUid = uid
-                self.status = "failed"
+    def _record_failure(self, task_info: Any) -> None:
+        """Keep the latest failed tasks only; count the ones pushed out so the total is still reported."""
+        if len(self._failed_tasks) == self._failed_tasks.maxlen:
+            self._failed_overflow += 1
+        self._failed_tasks.append(task_info)
 
-                class _Err:
-                    def __init__(self, message: str):
-                        self.code = "wait_error"
-                        self.message = message
-                        self.link = None
-
-                self.error = _Err(message)
-
-        return _Stub(uid, message)
+    @staticmethod
+    def _mk_failed_stub(uid: Optional[int], *, message: str, code: str = "wait_error") -> _FailedTask:
+        """Create a minimal object to record a failed/unknown task when sending or waiting for it fails."""
+        return _FailedTask(taskUid=uid, error=_FailedErr(code, message))
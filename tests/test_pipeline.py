@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Any, Dict
+from typing import Any, Dict, Iterator
 from unittest.mock import MagicMock, patch
 
 import pytest
@@ -43,13 +43,40 @@ def make_settings(overrides: Dict[str, Any] | None = None) -> Settings:
     return s
 
 
+def documents_response(payload: Dict[str, Any]) -> MagicMock:
+    resp = MagicMock()
+    resp.json.return_value = payload
+    return resp
+
+
+def task_json(uid: int, status: str, error: Dict[str, Any] | None = None) -> Dict[str, Any]:
+    return {
+        "uid": uid,
+        "indexUid": "test-index",
+        "status": status,
+        "type": "documentAdditionOrUpdate",
+        "error": error,
+        "enqueuedAt": "2025-01-01T00:00:00.000000Z",
+    }
+
+
+def tasks_response(*tasks: Dict[str, Any]) -> MagicMock:
+    return documents_response({"results": list(tasks)})
+
+
+@pytest.fixture(autouse=True)
+def mock_http() -> Iterator[MagicMock]:
+    with patch("httpx.Client") as mock_http_cls:
+        yield mock_http_cls.return_value
+
+
 # ---------------------------
 # Test
 # ---------------------------
 
 
-@patch("scrapy_meili_pipeline.meili_pipeline.meilisearch.Client")
-def test_open_spider_creates_index_if_missing(mock_client_cls: MagicMock):
+@patch("meilisearch.Client")
+def test_open_spider_creates_index_if_missing(mock_client_cls: MagicMock, mock_http: MagicMock):
     mock_client = MagicMock()
     mock_index = MagicMock()
     mock_client_cls.return_value = mock_client
@@ -62,7 +89,7 @@ def test_open_spider_creates_index_if_missing(mock_client_cls: MagicMock):
     resp.json.return_value = {"message": "index not found"}
     mock_client.get_index.side_effect = MeilisearchApiError({"message": "index not found"}, resp)
     mock_client.create_index.return_value = TaskInfoMock(task_uid=111, status="enqueued")
-    mock_client.wait_for_task.return_value = TaskInfoMock(task_uid=111, status="succeeded")
+    mock_http.get.return_value = tasks_response(task_json(111, "succeeded"))
     mock_client.index.return_value = mock_index
 
     s = make_settings()
@@ -71,11 +98,25 @@ def test_open_spider_creates_index_if_missing(mock_client_cls: MagicMock):
 
     mock_client_cls.assert_called_once_with("http://localhost:7700", None)
     mock_client.create_index.assert_called_once()
-    mock_client.wait_for_task.assert_called_once()
+    mock_http.get.assert_called_once_with("/tasks", params={"uids": "111", "limit": 1})
     assert pipe._index is mock_index
 
 
-@patch("scrapy_meili_pipeline.meili_pipeline.meilisearch.Client")
+@patch("meilisearch.Client")
+def test_open_spider_releases_http_client_when_index_setup_fails(mock_client_cls: MagicMock, mock_http: MagicMock):
+    mock_client_cls.return_value.get_index.side_effect = RuntimeError("connection refused")
+    mock_client_cls.return_value.create_index.side_effect = RuntimeError("connection refused")
+
+    pipe = MeiliSearchPipeline.from_crawler(type("C", (), {"settings": make_settings()}))
+    with pytest.raises(RuntimeError, match="connection refused"):
+        pipe.open_spider(DummySpider())
+
+    mock_http.close.assert_called_once()
+    assert pipe._http is None
+    assert pipe._sender is None
+
+
+@patch("meilisearch.Client")
 def test_open_spider_applies_index_settings_and_stashes_task(mock_client_cls: MagicMock):
     mock_client = MagicMock()
     mock_index = MagicMock()
@@ -94,8 +135,8 @@ def test_open_spider_applies_index_settings_and_stashes_task(mock_client_cls: Ma
     assert pipe._tasks[0].task_uid == 222
 
 
-@patch("scrapy_meili_pipeline.meili_pipeline.meilisearch.Client")
-def test_batching_success_flow_no_raise(mock_client_cls: MagicMock, caplog):
+@patch("meilisearch.Client")
+def test_batching_success_flow_no_raise(mock_client_cls: MagicMock, mock_http: MagicMock, caplog):
     mock_client = MagicMock()
     mock_index = MagicMock()
     mock_client_cls.return_value = mock_client
@@ -105,12 +146,9 @@ def test_batching_success_flow_no_raise(mock_client_cls: MagicMock, caplog):
 
     # Task per settings + add_documents
     mock_index.update_settings.return_value = TaskInfoMock(task_uid=10, status="enqueued")
-    mock_index.add_documents.return_value = TaskInfoMock(task_uid=123, status="enqueued")
+    mock_http.post.return_value = documents_response({"taskUid": 123, "status": "enqueued"})
 
-    mock_client.wait_for_task.side_effect = [
-        TaskInfoMock(task_uid=10, status="succeeded"),
-        TaskInfoMock(task_uid=123, status="succeeded"),
-    ]
+    mock_http.get.return_value = tasks_response(task_json(10, "succeeded"), task_json(123, "succeeded"))
 
     s = make_settings({"MEILI_BATCH_SIZE": 2})
     pipe = MeiliSearchPipeline.from_crawler(type("C", (), {"settings": s}))
@@ -118,16 +156,28 @@ def test_batching_success_flow_no_raise(mock_client_cls: MagicMock, caplog):
     pipe.open_spider(spider)
 
     pipe.process_item({"id": 1, "title": "A"}, spider)
-    pipe.process_item({"id": 2, "title": "B"}, spider)  # flush + check_all_tasks
+    pipe.process_item({"id": 2, "title": "B"}, spider)  # flush, no wait
+    pipe._collect_sent(wait=True)
 
-    assert pipe._tasks == []
-    assert pipe._failed_tasks == []
+    assert len(pipe._tasks) == 2
+    mock_http.get.assert_not_called()
+    mock_http.post.assert_called_once_with(
+        "/indexes/test-index/documents",
+        content=b'[{"id":1,"title":"A"},{"id":2,"title":"B"}]',
+        headers={"Content-Type": "application/json"},
+    )
 
     pipe.close_spider(spider)
 
+    # One status lookup for the whole range
+    mock_http.get.assert_called_once_with("/tasks", params={"uids": "10,123", "limit": 2})
+    assert pipe._tasks == []
+    assert not pipe._failed_tasks
+    mock_http.close.assert_called_once()
+
 
-@patch("scrapy_meili_pipeline.meili_pipeline.meilisearch.Client")
-def test_failed_task_is_logged_and_no_raise(mock_client_cls: MagicMock, caplog):
+@patch("meilisearch.Client")
+def test_failed_task_is_logged_and_no_raise(mock_client_cls: MagicMock, mock_http: MagicMock, caplog):
     mock_client = MagicMock()
     mock_index = MagicMock()
     mock_client_cls.return_value = mock_client
@@ -137,20 +187,20 @@ def test_failed_task_is_logged_and_no_raise(mock_client_cls: MagicMock, caplog):
 
     # Task: settings (failed) e batch (succeeded)
     mock_index.update_settings.return_value = TaskInfoMock(task_uid=20, status="enqueued")
-    mock_index.add_documents.return_value = TaskInfoMock(task_uid=30, status="enqueued")
+    mock_http.post.return_value = documents_response({"taskUid": 30, "status": "enqueued"})
 
-    mock_client.wait_for_task.side_effect = [
-        TaskInfoMock(task_uid=20, status="failed", error=ErrorInfoMock("ESET", "settings-error")),
-        TaskInfoMock(task_uid=30, status="succeeded"),
-    ]
+    mock_http.get.return_value = tasks_response(
+        task_json(20, "failed", error={"code": "ESET", "message": "settings-error"}),
+        task_json(30, "succeeded"),
+    )
 
-    s = make_settings({"MEILI_BATCH_SIZE": 1})
+    s = make_settings({"MEILI_BATCH_SIZE": 1, "MEILI_MAX_INFLIGHT": 1})
     pipe = MeiliSearchPipeline.from_crawler(type("C", (), {"settings": s}))
     spider = DummySpider()
     pipe.open_spider(spider)
 
     with caplog.at_level("ERROR"):
-        pipe.process_item({"id": 1, "title": "X"}, spider)  # flush -> check_all_tasks
+        pipe.process_item({"id": 1, "title": "X"}, spider)  # flush -> too many in flight -> check_all_tasks
 
     assert len(pipe._failed_tasks) == 1
     assert pipe._failed_tasks[0].status == "failed"
@@ -161,8 +211,8 @@ def test_failed_task_is_logged_and_no_raise(mock_client_cls: MagicMock, caplog):
     assert any("Meilisearch failed task" in rec.message for rec in caplog.records)
 
 
-@patch("scrapy_meili_pipeline.meili_pipeline.meilisearch.Client")
-def test_wait_for_task_exception_produces_failed_stub_but_no_raise(mock_client_cls: MagicMock, caplog):
+@patch("meilisearch.Client")
+def test_poll_exception_produces_failed_stub_but_no_raise(mock_client_cls: MagicMock, mock_http: MagicMock, caplog):
     mock_client = MagicMock()
     mock_index = MagicMock()
     mock_client_cls.return_value = mock_client
@@ -170,26 +220,29 @@ def test_wait_for_task_exception_produces_failed_stub_but_no_raise(mock_client_c
     mock_client.get_index.return_value = object()
     mock_client.index.return_value = mock_index
 
-    s = make_settings({"MEILI_INDEX_SETTINGS": {}, "MEILI_BATCH_SIZE": 2})
+    s = make_settings({"MEILI_INDEX_SETTINGS": {}, "MEILI_BATCH_SIZE": 2, "MEILI_MAX_INFLIGHT": 0})
     pipe = MeiliSearchPipeline.from_crawler(type("C", (), {"settings": s}))
     spider = DummySpider()
     pipe.open_spider(spider)
 
-    mock_index.add_documents.return_value = TaskInfoMock(task_uid=77, status="enqueued")
-    mock_client.wait_for_task.side_effect = RuntimeError("network timeout")
+    mock_http.post.return_value = documents_response({"taskUid": 77, "status": "enqueued"})
+    mock_http.get.side_effect = RuntimeError("network timeout")
 
     with caplog.at_level("WARNING"):
         pipe.process_item({"id": 1}, spider)
-        pipe.process_item({"id": 2}, spider)  # flush -> wait_for_task -> exception -> stub
+        pipe.process_item({"id": 2}, spider)  # flush -> poll tasks -> exception -> stub
 
     assert len(pipe._failed_tasks) == 1
     assert getattr(pipe._failed_tasks[0], "status", None) == "failed"
+    assert pipe._failed_tasks[0].taskUid == 77
+    assert pipe._failed_tasks[0].error.code == "wait_error"
+    assert pipe._failed_tasks[0].error.message == "network timeout"
 
     pipe.close_spider(spider)
 
 
-@patch("scrapy_meili_pipeline.meili_pipeline.meilisearch.Client")
-def test_task_without_task_uid_raises_immediately_on_flush(mock_client_cls: MagicMock):
+@patch("meilisearch.Client")
+def test_task_without_task_uid_is_recorded_as_send_failure(mock_client_cls: MagicMock, mock_http: MagicMock):
     mock_client = MagicMock()
     mock_index = MagicMock()
     mock_client_cls.return_value = mock_client
@@ -197,15 +250,384 @@ def test_task_without_task_uid_raises_immediately_on_flush(mock_client_cls: Magi
     mock_client.get_index.return_value = object()
     mock_client.index.return_value = mock_index
 
-    class BadTask:
-        pass
+    mock_http.post.return_value = documents_response({"status": "enqueued"})
+
+    s = make_settings({"MEILI_INDEX_SETTINGS": {}, "MEILI_BATCH_SIZE": 1})
+    pipe = MeiliSearchPipeline.from_crawler(type("C", (), {"settings": s}))
+    spider = DummySpider()
+    pipe.open_spider(spider)
+
+    pipe.process_item({"id": 1}, spider)  # flush is handed to the sender thread
+    pipe._collect_sent(wait=True)
+
+    assert len(pipe._failed_tasks) == 1
+    assert pipe._failed_tasks[0].taskUid is None
+    assert pipe._failed_tasks[0].error.code == "send_error"
+    assert "Task object has no uid" in pipe._failed_tasks[0].error.message
+
+
+@patch("meilisearch.Client")
+def test_close_reports_failed_send_and_still_sends_queued_batches(
+    mock_client_cls: MagicMock, mock_http: MagicMock, caplog
+):
+    import httpx
+
+    mock_client_cls.return_value.get_index.return_value = object()
+    request = httpx.Request("POST", "http://localhost:7700/indexes/test/documents")
+    mock_http.post.side_effect = [
+        httpx.Response(413, request=request),
+        documents_response({"taskUid": 2, "status": "enqueued"}),
+    ]
+    mock_http.get.return_value = tasks_response(task_json(2, "succeeded"))
+
+    s = make_settings({"MEILI_INDEX_SETTINGS": {}, "MEILI_BATCH_SIZE": 1, "MEILI_MAX_INFLIGHT": 8})
+    pipe = MeiliSearchPipeline.from_crawler(type("C", (), {"settings": s}))
+    spider = DummySpider()
+    pipe.open_spider(spider)
+    pipe.process_item({"id": 1}, spider)
+    pipe.process_item({"id": 2}, spider)
+
+    with caplog.at_level("ERROR"):
+        pipe.close_spider(spider)
+
+    assert mock_http.post.call_count == 2
+    mock_http.get.assert_called_once_with("/tasks", params={"uids": "2", "limit": 1})
+    assert [t.error.code for t in pipe._failed_tasks] == ["send_error"]
+    assert "MeiliSearchPipeline: 1 failures (0 truncated)" in caplog.text
+    mock_http.close.assert_called_once()
+    assert pipe._sender is None
+
+
+@patch("meilisearch.Client")
+def test_process_item_converts_non_dict_items(mock_client_cls: MagicMock):
+    from dataclasses import dataclass
+
+    import scrapy
+
+    @dataclass
+    class Product:
+        id: int
+        title: str
+
+    class Seller(scrapy.Item):
+        name = scrapy.Field()
+
+    mock_client_cls.return_value.get_index.return_value = MagicMock(primary_key="id")
+
+    s = make_settings({"MEILI_INDEX_SETTINGS": {}, "MEILI_BATCH_SIZE": 10})
+    pipe = MeiliSearchPipeline.from_crawler(type("C", (), {"settings": s}))
+    spider = DummySpider()
+    pipe.open_spider(spider)
+
+    plain = {"id": 1, "title": "A", "seller": Seller(name="S")}
+    pipe.process_item(plain, spider)
+    pipe.process_item(Product(id=2, title="B"), spider)
+    plain["title"] = "changed by a later pipeline"
 
-    mock_index.add_documents.return_value = BadTask()
+    # Buffered documents are snapshots, with nested items converted too
+    assert pipe._buffer[1] == {"id": 1, "title": "A", "seller": {"name": "S"}}
+    assert type(pipe._buffer[1]["seller"]) is dict
+    assert pipe._buffer[2] == {"id": 2, "title": "B"}
+
+
+def test_batch_size_grows_while_per_doc_latency_drops():
+    s = make_settings({"MEILI_BATCH_SIZE": 100, "MEILI_MAX_BATCH": 300})
+    pipe = MeiliSearchPipeline.from_crawler(type("C", (), {"settings": s}))
+
+    pipe._adapt_batch_size(1.0)  # first sample only sets the baseline
+    assert pipe._cur_batch == 100
+
+    pipe._adapt_batch_size(0.5)
+    assert pipe._cur_batch == 200
+
+    pipe._adapt_batch_size(0.48)  # plateau: less than 10% better
+    assert pipe._cur_batch == 200
+
+    pipe._adapt_batch_size(0.2)
+    pipe._adapt_batch_size(0.1)
+    assert pipe._cur_batch == 300  # capped at MEILI_MAX_BATCH
+
+
+@patch("meilisearch.Client")
+def test_tasks_missing_from_poll_response_are_recorded_as_failures(mock_client_cls: MagicMock, mock_http: MagicMock):
+    mock_client_cls.return_value.get_index.return_value = object()
+    mock_http.post.return_value = documents_response({"taskUid": 8, "status": "enqueued"})
+    mock_http.get.return_value = tasks_response()
 
     s = make_settings({"MEILI_INDEX_SETTINGS": {}, "MEILI_BATCH_SIZE": 1})
     pipe = MeiliSearchPipeline.from_crawler(type("C", (), {"settings": s}))
     spider = DummySpider()
     pipe.open_spider(spider)
+    pipe.process_item({"id": 1}, spider)
+    pipe.close_spider(spider)
 
-    with pytest.raises(RuntimeError, match="Task object has no uid"):
-        pipe.process_item({"id": 1}, spider)
+    mock_http.get.assert_called_once()  # not polled again until the timeout
+    assert len(pipe._failed_tasks) == 1
+    assert pipe._failed_tasks[0].taskUid == 8
+    assert pipe._failed_tasks[0].error.message == "task not found"
+
+
+@patch("meilisearch.Client")
+def test_polls_until_all_tasks_are_terminal(mock_client_cls: MagicMock, mock_http: MagicMock):
+    mock_client_cls.return_value.get_index.return_value = object()
+    mock_http.post.return_value = documents_response({"taskUid": 5, "status": "enqueued"})
+    mock_http.get.side_effect = [
+        tasks_response(task_json(5, "processing")),
+        tasks_response(task_json(5, "succeeded")),
+    ]
+
+    s = make_settings({"MEILI_INDEX_SETTINGS": {}, "MEILI_BATCH_SIZE": 1})
+    pipe = MeiliSearchPipeline.from_crawler(type("C", (), {"settings": s}))
+    spider = DummySpider()
+    pipe.open_spider(spider)
+    pipe.process_item({"id": 1}, spider)
+    pipe.close_spider(spider)
+
+    assert mock_http.get.call_count == 2
+    assert not pipe._failed_tasks
+
+
+@patch("scrapy_meili_pipeline.meili_pipeline.time.sleep")
+def test_poll_backs_off_exponentially_up_to_task_interval(mock_sleep: MagicMock, mock_http: MagicMock):
+    mock_http.get.side_effect = [tasks_response(task_json(1, "processing"))] * 9 + [
+        tasks_response(task_json(1, "succeeded"))
+    ]
+
+    s = make_settings({"MEILI_TASK_TIMEOUT": 60, "MEILI_TASK_INTERVAL": 1})
+    pipe = MeiliSearchPipeline.from_crawler(type("C", (), {"settings": s}))
+    results = pipe._poll_tasks(mock_http, [1])
+
+    assert results[0].status == "succeeded"
+    delays = [c.args[0] for c in mock_sleep.call_args_list]
+    assert delays == pytest.approx([0.01, 0.02, 0.04, 0.08, 0.16, 0.32, 0.64, 1, 1])
+
+
+def test_large_batches_are_gzipped():
+    import gzip
+    import json
+
+    batch = [{"id": i, "content": "x" * 100} for i in range(1000)]
+    payload, headers = MeiliSearchPipeline._encode_batch(batch)
+
+    assert headers == {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+    assert json.loads(gzip.decompress(payload)) == batch
+
+
+def test_non_str_keys_are_encoded_like_json():
+    import json
+
+    payload, headers = MeiliSearchPipeline._encode_batch([{"id": 1, "counts": {2023: 5}}])
+
+    assert headers == {"Content-Type": "application/json"}
+    assert json.loads(payload) == [{"id": 1, "counts": {"2023": 5}}]
+
+
+@patch("meilisearch.Client")
+def test_flush_does_not_block_on_http(mock_client_cls: MagicMock, mock_http: MagicMock):
+    import threading
+
+    mock_client_cls.return_value.get_index.return_value = object()
+    release = threading.Event()
+
+    def slow_post(*args: Any, **kwargs: Any) -> MagicMock:
+        release.wait(timeout=5)
+        return documents_response({"taskUid": 9, "status": "enqueued"})
+
+    mock_http.post.side_effect = slow_post
+    mock_http.get.return_value = tasks_response(task_json(9, "succeeded"))
+
+    s = make_settings({"MEILI_INDEX_SETTINGS": {}, "MEILI_BATCH_SIZE": 1})
+    pipe = MeiliSearchPipeline.from_crawler(type("C", (), {"settings": s}))
+    spider = DummySpider()
+    pipe.open_spider(spider)
+
+    pipe.process_item({"id": 1}, spider)  # returns while the POST is still in flight
+    assert len(pipe._sending) == 1
+    assert pipe._tasks == []
+
+    release.set()
+    pipe.close_spider(spider)
+
+    assert not pipe._failed_tasks
+    mock_http.get.assert_called_once()
+
+
+@patch("meilisearch.Client")
+def test_close_without_items_does_not_wait_for_settings_task(mock_client_cls: MagicMock, mock_http: MagicMock):
+    mock_client = MagicMock()
+    mock_index = MagicMock()
+    mock_client_cls.return_value = mock_client
+
+    mock_client.get_index.return_value = object()
+    mock_client.index.return_value = mock_index
+    mock_index.update_settings.return_value = TaskInfoMock(task_uid=222, status="enqueued")
+
+    s = make_settings()
+    pipe = MeiliSearchPipeline.from_crawler(type("C", (), {"settings": s}))
+    spider = DummySpider()
+    pipe.open_spider(spider)
+    pipe.close_spider(spider)
+
+    mock_http.get.assert_not_called()
+    assert not pipe._failed_tasks
+
+
+@patch("meilisearch.Client")
+def test_duplicate_primary_keys_are_collapsed_in_buffer(mock_client_cls: MagicMock, mock_http: MagicMock):
+    mock_client_cls.return_value.get_index.return_value = MagicMock(primary_key="id")
+    mock_http.post.return_value = documents_response({"taskUid": 4, "status": "enqueued"})
+    mock_http.get.return_value = tasks_response(task_json(4, "succeeded"))
+
+    s = make_settings({"MEILI_INDEX_SETTINGS": {}, "MEILI_BATCH_SIZE": 10})
+    pipe = MeiliSearchPipeline.from_crawler(type("C", (), {"settings": s}))
+    spider = DummySpider()
+    pipe.open_spider(spider)
+
+    pipe.process_item({"id": 1, "title": "old"}, spider)
+    pipe.process_item({"title": "no id"}, spider)
+    pipe.process_item({"title": "no id"}, spider)
+    pipe.process_item({"id": 1, "title": "new"}, spider)
+    assert len(pipe._buffer) == 3
+
+    pipe.close_spider(spider)
+
+    assert mock_http.post.call_args.kwargs["content"] == (
+        b'[{"id":1,"title":"new"},{"title":"no id"},{"title":"no id"}]'
+    )
+
+
+def test_small_batch_size_logs_a_warning(caplog):
+    with caplog.at_level("WARNING"):
+        MeiliSearchPipeline.from_crawler(type("C", (), {"settings": make_settings({"MEILI_BATCH_SIZE": 3})}))
+    assert any("MEILI_BATCH_SIZE=3 is very small" in rec.message for rec in caplog.records)
+
+    caplog.clear()
+    with caplog.at_level("WARNING"):
+        MeiliSearchPipeline.from_crawler(type("C", (), {"settings": make_settings({"MEILI_BATCH_SIZE": 100})}))
+    assert not caplog.records
+
+
+def test_failed_tasks_are_bounded_and_overflow_is_counted(caplog):
+    from scrapy_meili_pipeline.meili_pipeline import _MAX_FAILED_TASKS
+
+    pipe = MeiliSearchPipeline.from_crawler(type("C", (), {"settings": make_settings()}))
+    for uid in range(_MAX_FAILED_TASKS + 5):
+        pipe._record_failure(pipe._mk_failed_stub(uid, message="boom"))
+
+    assert len(pipe._failed_tasks) == _MAX_FAILED_TASKS
+    assert pipe._failed_overflow == 5
+    assert pipe._failed_tasks[0].taskUid == 5  # oldest ones were dropped
+
+    with caplog.at_level("ERROR"):
+        pipe.close_spider(DummySpider())
+    assert any(rec.getMessage() == "MeiliSearchPipeline: 1005 failures (5 truncated)" for rec in caplog.records)
+
+
+def test_accept_hook_skips_items():
+    class OnlyProducts(MeiliSearchPipeline):
+        def accept(self, item: Any) -> bool:
+            return item.get("type") == "product"
+
+    pipe = OnlyProducts.from_crawler(type("C", (), {"settings": make_settings({"MEILI_BATCH_SIZE": 10})}))
+    spider = DummySpider()
+
+    page = {"id": 1, "type": "page"}
+    assert pipe.process_item(page, spider) is page
+    pipe.process_item({"id": 2, "type": "product"}, spider)
+
+    assert list(pipe._buffer) == [2]
+
+
+def test_batch_size_is_fixed_without_max_batch():
+    pipe = MeiliSearchPipeline.from_crawler(type("C", (), {"settings": make_settings({"MEILI_BATCH_SIZE": 100})}))
+
+    pipe._adapt_batch_size(1.0)
+    pipe._adapt_batch_size(0.1)
+
+    assert pipe.max_batch_size == 100
+    assert pipe._cur_batch == 100
+
+
+@patch("meilisearch.Client")
+def test_buffer_dedups_on_primary_key_of_existing_index(mock_client_cls: MagicMock, mock_http: MagicMock):
+    mock_client_cls.return_value.get_index.return_value = MagicMock(primary_key="sku")
+
+    s = make_settings({"MEILI_INDEX_SETTINGS": {}, "MEILI_BATCH_SIZE": 10})
+    s.set("MEILI_PRIMARY_KEY", None)
+    pipe = MeiliSearchPipeline.from_crawler(type("C", (), {"settings": s}))
+    spider = DummySpider()
+    pipe.open_spider(spider)
+    pipe.process_item({"id": 1, "sku": "A"}, spider)
+    pipe.process_item({"id": 2, "sku": "A"}, spider)
+
+    assert list(pipe._buffer.values()) == [{"id": 2, "sku": "A"}]
+
+
+@patch("meilisearch.Client")
+def test_buffer_ignores_configured_primary_key_of_existing_index(mock_client_cls: MagicMock, mock_http: MagicMock):
+    mock_client_cls.return_value.get_index.return_value = MagicMock(primary_key="id")
+
+    s = make_settings({"MEILI_INDEX_SETTINGS": {}, "MEILI_BATCH_SIZE": 10})
+    s.set("MEILI_PRIMARY_KEY", "sku")  # only used when the index is created
+    pipe = MeiliSearchPipeline.from_crawler(type("C", (), {"settings": s}))
+    spider = DummySpider()
+    pipe.open_spider(spider)
+    pipe.process_item({"id": 1, "sku": "A"}, spider)
+    pipe.process_item({"id": 2, "sku": "A"}, spider)
+
+    assert list(pipe._buffer.values()) == [{"id": 1, "sku": "A"}, {"id": 2, "sku": "A"}]
+
+
+@patch("meilisearch.Client")
+def test_buffer_keeps_every_document_when_primary_key_is_unknown(mock_client_cls: MagicMock, mock_http: MagicMock):
+    mock_client_cls.return_value.get_index.return_value = MagicMock(primary_key=None)
+
+    s = make_settings({"MEILI_INDEX_SETTINGS": {}, "MEILI_BATCH_SIZE": 10})
+    s.set("MEILI_PRIMARY_KEY", None)
+    pipe = MeiliSearchPipeline.from_crawler(type("C", (), {"settings": s}))
+    spider = DummySpider()
+    pipe.open_spider(spider)
+    pipe.process_item({"id": 1, "title": "old"}, spider)
+    pipe.process_item({"id": 1, "title": "new"}, spider)
+
+    assert len(pipe._buffer) == 2
+
+
+@patch("meilisearch.Client")
+def test_buffer_keeps_documents_with_unhashable_primary_key(mock_client_cls: MagicMock, mock_http: MagicMock):
+    mock_client_cls.return_value.get_index.return_value = object()
+
+    pipe = MeiliSearchPipeline.from_crawler(type("C", (), {"settings": make_settings({"MEILI_BATCH_SIZE": 10})}))
+    spider = DummySpider()
+    pipe.open_spider(spider)
+    pipe.process_item({"id": ["a", "b"]}, spider)
+    pipe.process_item({"id": ["a", "b"]}, spider)
+
+    assert len(pipe._buffer) == 2
+
+
+@patch("meilisearch.Client")
+def test_rejected_batch_keeps_meilisearch_error(mock_client_cls: MagicMock, mock_http: MagicMock):
+    import httpx
+
+    mock_client_cls.return_value.get_index.return_value = object()
+    error = {
+        "message": "Document identifier `a b` is invalid.",
+        "code": "invalid_document_id",
+        "type": "invalid_request",
+        "link": "https://docs.meilisearch.com/errors#invalid_document_id",
+    }
+    request = httpx.Request("POST", "http://localhost:7700/indexes/test/documents")
+    mock_http.post.return_value = httpx.Response(400, json=error, request=request)
+
+    s = make_settings({"MEILI_INDEX_SETTINGS": {}, "MEILI_BATCH_SIZE": 1})
+    pipe = MeiliSearchPipeline.from_crawler(type("C", (), {"settings": s}))
+    spider = DummySpider()
+    pipe.open_spider(spider)
+    pipe.process_item({"id": "a b"}, spider)
+    pipe.close_spider(spider)
+
+    assert len(pipe._failed_tasks) == 1
+    assert pipe._failed_tasks[0].error.code == "invalid_document_id"
+    assert pipe._failed_tasks[0].error.message == error["message"]
+    assert pipe._failed_tasks[0].error.link == error["link"]